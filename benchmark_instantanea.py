@@ -0,0 +1,77 @@
+# Compara el coste de Biblioteca.snapshot() tras una escritura con el de un copy.deepcopy completo del estado.
+# Uso: python benchmark_instantanea.py [--libros 50000] [--prestamos 20000] [--repeticiones 10]
+import argparse
+import contextlib
+import copy
+import io
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+
+def importar_biblioteca():
+    # El módulo escribe archivos de ejemplo al importarse; se importa desde un directorio temporal.
+    anterior = os.getcwd()
+    with tempfile.TemporaryDirectory() as directorio:
+        os.chdir(directorio)
+        try:
+            with contextlib.redirect_stdout(io.StringIO()):
+                import biblioteca_digital
+        finally:
+            os.chdir(anterior)
+    return biblioteca_digital
+
+
+def construir_biblioteca(bd, total_libros, total_prestamos):
+    biblioteca = bd.Biblioteca()
+    for i in range(total_libros):
+        isbn = f"isbn-{i}"
+        biblioteca.libros[isbn] = bd.Libro(f"Titulo {i}", f"Autor {i % 500}", isbn, 3)
+    for i in range(max(1, total_prestamos // 10)):
+        biblioteca.registrar_usuario(f"Usuario {i}", f"U{i}")
+    with contextlib.redirect_stdout(io.StringIO()):
+        for i in range(total_prestamos):
+            biblioteca.registrar_prestamo(f"isbn-{i % total_libros}", f"U{i % max(1, total_prestamos // 10)}", "2024-01-01")
+    return biblioteca
+
+
+def medir(biblioteca, repeticiones):
+    tiempo_instantanea = 0.0
+    with contextlib.redirect_stdout(io.StringIO()):
+        for i in range(repeticiones):
+            # Una escritura real entre instantáneas, como ocurriría con los mostradores abiertos.
+            if i % 2 == 0:
+                biblioteca.registrar_prestamo("isbn-0", "U0", "2024-02-01")
+            else:
+                biblioteca.registrar_devolucion("isbn-0", "U0", "2024-02-02")
+            inicio = time.perf_counter()
+            biblioteca.snapshot()
+            tiempo_instantanea += time.perf_counter() - inicio
+
+    inicio = time.perf_counter()
+    for _ in range(repeticiones):
+        copy.deepcopy((dict(biblioteca.libros), biblioteca.usuarios, biblioteca.prestamos))
+    tiempo_copia_profunda = time.perf_counter() - inicio
+
+    return tiempo_instantanea / repeticiones, tiempo_copia_profunda / repeticiones
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--libros", type=int, default=50000)
+    parser.add_argument("--prestamos", type=int, default=20000)
+    parser.add_argument("--repeticiones", type=int, default=10)
+    args = parser.parse_args()
+
+    bd = importar_biblioteca()
+    biblioteca = construir_biblioteca(bd, args.libros, args.prestamos)
+    biblioteca.snapshot()
+    instantanea, copia_profunda = medir(biblioteca, args.repeticiones)
+
+    print(f"Libros: {args.libros}, préstamos: {args.prestamos}, repeticiones: {args.repeticiones}")
+    print(f"snapshot() tras una escritura: {instantanea * 1000:.2f} ms")
+    print(f"copy.deepcopy del estado:      {copia_profunda * 1000:.2f} ms")
+    print(f"Relación: {copia_profunda / instantanea:.1f}x")
@@ -252,6 +252,12 @@ import json
 import datetime
 
 # Re-defining classes to ensure they are available in the current scope for instantiation in the same block
+def notificar_cambio(objeto):
+    # Avisa a las bibliotecas que siguen este objeto (ver Biblioteca.snapshot) de que ha sido modificado,
+    # también cuando el cambio se hace directamente, p. ej. libro.cantidad += 5 al reponer ejemplares.
+    for modificados in objeto.__dict__.get('_seguimiento', ()):
+        modificados.add(objeto)
+
 class Libro:
     def __init__(self, titulo, autor, isbn, cantidad):
         if not titulo or not isinstance(titulo, str):
@@ -268,6 +274,10 @@ class Libro:
         self.isbn = isbn
         self.cantidad = cantidad
 
+    def __setattr__(self, nombre, valor):
+        super().__setattr__(nombre, valor)
+        notificar_cambio(self)
+
     def __str__(self):
         return f"{self.titulo} por {self.autor} (ISBN: {self.isbn})"
 
@@ -294,18 +304,24 @@ class Usuario:
         self.id_usuario = id_usuario
         self.libros_prestados = []
 
+    def __setattr__(self, nombre, valor):
+        super().__setattr__(nombre, valor)
+        notificar_cambio(self)
+
     def __str__(self):
         return f"{self.nombre} (ID: {self.id_usuario})"
 
     def agregar_libro_prestado(self, libro):
         if isinstance(libro, Libro):
             self.libros_prestados.append(libro)
+            notificar_cambio(self)
         else:
             raise ValueError("Se debe agregar un objeto de tipo Libro.")
 
     def remover_libro_prestado(self, libro):
         if isinstance(libro, Libro) and libro in self.libros_prestados:
             self.libros_prestados.remove(libro)
+            notificar_cambio(self)
             return True
         return False
 
@@ -323,6 +339,10 @@ class Prestamo:
         self.fecha_prestamo = fecha_prestamo
         self.fecha_devolucion = None
 
+    def __setattr__(self, nombre, valor):
+        super().__setattr__(nombre, valor)
+        notificar_cambio(self)
+
     def __str__(self):
         return f"Préstamo de '{self.libro.titulo}' a '{self.usuario.nombre}' el {self.fecha_prestamo}"
 
@@ -588,20 +608,489 @@ if __name__ == "__main__":
     reporte_nov_2023 = biblioteca.generar_reporte_mensual(11, 2023)
     print(reporte_nov_2023)
 
-class Biblioteca:
+import threading
+from collections import deque
+
+# Eventos publicados por la Biblioteca para sistemas externos (notificaciones, contabilidad de multas, etc.)
+class EventoPrestamoRegistrado:
+    def __init__(self, prestamo):
+        self.prestamo = prestamo
+        self.isbn = prestamo.libro.isbn
+        self.id_usuario = prestamo.usuario.id_usuario
+        self.fecha = prestamo.fecha_prestamo
+        self.secuencia = None
+
+    def __str__(self):
+        return f"Préstamo registrado: ISBN {self.isbn} a usuario {self.id_usuario} el {self.fecha}"
+
+class EventoDevolucionRegistrada:
+    def __init__(self, prestamo, multa):
+        self.prestamo = prestamo
+        self.isbn = prestamo.libro.isbn
+        self.id_usuario = prestamo.usuario.id_usuario
+        self.fecha = prestamo.fecha_devolucion
+        self.multa = multa
+        self.secuencia = None
+
+    def __str__(self):
+        return f"Devolución registrada: ISBN {self.isbn} por usuario {self.id_usuario} el {self.fecha} (multa {self.multa:.2f} euros)"
+
+class EventoCambioStock:
+    def __init__(self, libro, cantidad_anterior):
+        self.isbn = libro.isbn
+        self.cantidad_anterior = cantidad_anterior
+        self.cantidad_nueva = libro.cantidad
+        self.secuencia = None
+
+    def __str__(self):
+        return f"Cambio de stock: ISBN {self.isbn} de {self.cantidad_anterior} a {self.cantidad_nueva}"
+
+class EventoReservaAtendida:
+    def __init__(self, prestamo):
+        self.prestamo = prestamo
+        self.isbn = prestamo.libro.isbn
+        self.id_usuario = prestamo.usuario.id_usuario
+        self.fecha = prestamo.fecha_prestamo
+        self.secuencia = None
+
+    def __str__(self):
+        return f"Reserva atendida: ISBN {self.isbn} asignado a usuario {self.id_usuario} el {self.fecha}"
+
+class Suscripcion:
+    POLITICAS = ('descartar_nuevo', 'descartar_antiguo', 'bloquear')
+
+    def __init__(self, bus, tipos=None, capacidad=100, politica='descartar_nuevo', espera_maxima=1.0):
+        if not isinstance(capacidad, int) or capacidad <= 0:
+            raise ValueError("La capacidad de la cola debe ser un número entero positivo.")
+        if politica not in self.POLITICAS:
+            raise ValueError(f"La política de desbordamiento debe ser una de {self.POLITICAS}.")
+
+        self.bus = bus
+        self.tipos = tuple(tipos) if tipos else None
+        self.capacidad = capacidad
+        self.politica = politica
+        self.espera_maxima = espera_maxima
+        self.cola = deque()
+        self.condicion = threading.Condition()
+        self.eventos_entregados = 0
+        self.eventos_descartados = 0
+        self.desbordamientos = 0
+
+    def __len__(self):
+        return len(self.cola)
+
+    def acepta(self, evento):
+        return self.tipos is None or isinstance(evento, self.tipos)
+
+    def encolar(self, evento):
+        with self.condicion:
+            if len(self.cola) >= self.capacidad:
+                self.desbordamientos += 1
+                if self.politica == 'descartar_antiguo':
+                    self.cola.popleft()
+                    self.eventos_descartados += 1
+                elif self.politica == 'bloquear':
+                    # Contrapresión: el publicador espera a que el consumidor libere espacio.
+                    if not self.condicion.wait_for(lambda: len(self.cola) < self.capacidad, self.espera_maxima):
+                        self.eventos_descartados += 1
+                        return False
+                else:
+                    self.eventos_descartados += 1
+                    return False
+            self.cola.append(evento)
+            self.eventos_entregados += 1
+            self.condicion.notify_all()
+            return True
+
+    def recibir(self, timeout=None):
+        with self.condicion:
+            if not self.condicion.wait_for(lambda: len(self.cola) > 0, timeout):
+                return None
+            evento = self.cola.popleft()
+            self.condicion.notify_all()
+            return evento
+
+    def vaciar(self):
+        with self.condicion:
+            eventos = list(self.cola)
+            self.cola.clear()
+            self.condicion.notify_all()
+            return eventos
+
+    def cancelar(self):
+        self.bus.desuscribir(self)
+
+    def estadisticas(self):
+        return {
+            "pendientes": len(self.cola),
+            "capacidad": self.capacidad,
+            "eventos_entregados": self.eventos_entregados,
+            "eventos_descartados": self.eventos_descartados,
+            "desbordamientos": self.desbordamientos
+        }
+
+class BusEventos:
     def __init__(self):
-        self.libros = {}
-        self.usuarios = {}
+        self.suscripciones = ()
+        self._lock = threading.Lock()
+
+    def __bool__(self):
+        # Permite al publicador comprobar en O(1) si vale la pena construir el evento.
+        return bool(self.suscripciones)
+
+    def suscribir(self, tipos=None, capacidad=100, politica='descartar_nuevo', espera_maxima=1.0):
+        suscripcion = Suscripcion(self, tipos, capacidad, politica, espera_maxima)
+        with self._lock:
+            self.suscripciones = self.suscripciones + (suscripcion,)
+        return suscripcion
+
+    def desuscribir(self, suscripcion):
+        with self._lock:
+            self.suscripciones = tuple(s for s in self.suscripciones if s is not suscripcion)
+
+    def publicar(self, evento):
+        # Se itera sobre una tupla inmutable, así suscribir/desuscribir no necesita bloquear a los publicadores.
+        for suscripcion in self.suscripciones:
+            if suscripcion.acepta(evento):
+                suscripcion.encolar(evento)
+
+import os
+import re
+import gzip
+import time
+from types import MappingProxyType
+from operator import attrgetter
+from collections import namedtuple, OrderedDict
+
+# Registros inmutables usados por las instantáneas de lectura. Cada registro se reutiliza entre
+# versiones mientras el objeto vivo correspondiente no cambie (copia en escritura por registro).
+class LibroCongelado(namedtuple('LibroCongelado', ['titulo', 'autor', 'isbn', 'cantidad'])):
+    __slots__ = ()
+
+    def __str__(self):
+        return f"{self.titulo} por {self.autor} (ISBN: {self.isbn})"
+
+    disponible = Libro.disponible
+
+class UsuarioCongelado(namedtuple('UsuarioCongelado', ['nombre', 'id_usuario', 'isbns_prestados'])):
+    __slots__ = ()
+
+    def __str__(self):
+        return f"{self.nombre} (ID: {self.id_usuario})"
+
+class PrestamoCongelado(namedtuple('PrestamoCongelado', ['isbn', 'titulo', 'id_usuario', 'nombre', 'fecha_prestamo', 'fecha_devolucion'])):
+    __slots__ = ()
+
+    def __str__(self):
+        return f"Préstamo de '{self.titulo}' a '{self.nombre}' el {self.fecha_prestamo}"
+
+    calcular_multa = Prestamo.calcular_multa
+
+class LectorAcotado:
+    # Limita la lectura de un segmento a los bytes que existían cuando se tomó la instantánea.
+    def __init__(self, archivo, limite):
+        self.archivo = archivo
+        self.limite = limite
+        self.leidos = 0
+
+    def read(self, n=-1):
+        restante = self.limite - self.leidos
+        if n is None or n < 0 or n > restante:
+            n = restante
+        datos = self.archivo.read(n)
+        self.leidos += len(datos)
+        return datos
+
+class InstantaneaBiblioteca:
+    def __init__(self, version, libros, usuarios, prestamos, directorio_archivo=None, tamanos_segmentos=None):
+        self.version = version
+        self.libros = MappingProxyType(libros)
+        self.usuarios = MappingProxyType(usuarios)
+        self.prestamos = tuple(prestamos)
+        self.directorio_archivo = directorio_archivo
+        self.tamanos_segmentos = MappingProxyType(dict(tamanos_segmentos or {}))
+
+    def prestamos_archivados(self, mes, anio):
+        tamano = self.tamanos_segmentos.get((anio, mes))
+        if not tamano:
+            return
+        ruta = ruta_segmento(self.directorio_archivo, mes, anio)
+        with open(ruta, 'rb') as f:
+            with gzip.GzipFile(fileobj=LectorAcotado(f, tamano), mode='rb') as comprimido:
+                for linea in comprimido:
+                    if linea.strip():
+                        datos = json.loads(linea)
+                        yield PrestamoCongelado(
+                            datos['isbn'], datos['titulo'], datos['id_usuario'], datos['nombre'],
+                            datetime.date.fromisoformat(datos['fecha_prestamo']),
+                            datetime.date.fromisoformat(datos['fecha_devolucion'])
+                        )
+
+    def prestamos_del_mes(self, mes, anio):
+        yield from self.prestamos_archivados(mes, anio)
+        for prestamo in self.prestamos:
+            if prestamo.fecha_prestamo.month == mes and prestamo.fecha_prestamo.year == anio:
+                yield prestamo
+
+    def calcular_estadisticas(self):
+        total_libros = len(self.libros)
+        libros_disponibles = sum(libro.cantidad for libro in self.libros.values())
+        total_usuarios = len(self.usuarios)
+        prestamos_activos = sum(1 for prestamo in self.prestamos if prestamo.fecha_devolucion is None)
+        total_multas = sum(prestamo.calcular_multa(datetime.date.today()) for prestamo in self.prestamos if prestamo.fecha_devolucion is None)
+
+        return {
+            "total_libros": total_libros,
+            "libros_disponibles": libros_disponibles,
+            "total_usuarios": total_usuarios,
+            "prestamos_activos": prestamos_activos,
+            "total_multas_pendientes": total_multas
+        }
+
+    def generar_reporte_mensual(self, mes, anio):
+        reporte = f"Reporte Mensual de la Biblioteca - {mes}/{anio}\n"
+        reporte += "=" * 40 + "\n\n"
+
+        hubo_prestamos = False
+        for prestamo in self.prestamos_del_mes(mes, anio):
+            if not hubo_prestamos:
+                reporte += "Detalle de Préstamos del Mes:\n"
+                hubo_prestamos = True
+            estado = "Activo" if prestamo.fecha_devolucion is None else f"Devuelto el {prestamo.fecha_devolucion}"
+            multa = prestamo.calcular_multa(datetime.date.today() if prestamo.fecha_devolucion is None else prestamo.fecha_devolucion)
+            reporte += f"- Libro: '{prestamo.titulo}' (ISBN: {prestamo.isbn})\n"
+            reporte += f"  Usuario: '{prestamo.nombre}' (ID: {prestamo.id_usuario})\n"
+            reporte += f"  Fecha Préstamo: {prestamo.fecha_prestamo}\n"
+            reporte += f"  Estado: {estado}\n"
+            reporte += f"  Multa calculada: {multa:.2f} euros\n"
+            reporte += "-----\n"
+
+        if not hubo_prestamos:
+            reporte += "No hubo préstamos registrados en este mes.\n"
+
+        reporte += "\n" + "=" * 40 + "\n"
+        reporte += "Estadísticas Generales:\n"
+        estadisticas = self.calcular_estadisticas()
+        for key, value in estadisticas.items():
+            reporte += f"- {key.replace('_', ' ').title()}: {value}\n"
+
+        return reporte
+
+def ruta_segmento(directorio_archivo, mes, anio):
+    return os.path.join(directorio_archivo, f"prestamos_{anio:04d}_{mes:02d}.jsonl.gz")
+
+# Campos de cada objeto vivo que se copian a su registro congelado.
+CAMPOS_LIBRO = attrgetter('titulo', 'autor', 'isbn', 'cantidad')
+CAMPOS_PRESTAMO = attrgetter('libro.isbn', 'libro.titulo', 'usuario.id_usuario', 'usuario.nombre', 'fecha_prestamo', 'fecha_devolucion')
+
+def campos_usuario(usuario):
+    return (usuario.nombre, usuario.id_usuario, tuple(libro.isbn for libro in usuario.libros_prestados))
+
+PATRON_SEGMENTO = re.compile(r"^prestamos_(\d{4})_(\d{2})\.jsonl\.gz$")
+# Tamaño válido de cada segmento; lo que haya después es el resto de una escritura interrumpida.
+INDICE_SEGMENTOS = "indice_segmentos.json"
+
+class DiccionarioVersionado(dict):
+    # Diccionario que incrementa su versión con cada modificación y anota las claves afectadas, para
+    # invalidar cachés y actualizar las instantáneas solo en esas claves.
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.version = 0
+        self.claves_cambiadas = set(self)
+
+    def _cambio(self, claves):
+        self.claves_cambiadas.update(claves)
+        self.version += 1
+
+    def __setitem__(self, clave, valor):
+        super().__setitem__(clave, valor)
+        self._cambio((clave,))
+
+    def __delitem__(self, clave):
+        super().__delitem__(clave)
+        self._cambio((clave,))
+
+    def pop(self, clave, *args):
+        if clave not in self:
+            return super().pop(clave, *args)
+        valor = super().pop(clave)
+        self._cambio((clave,))
+        return valor
+
+    def popitem(self):
+        elemento = super().popitem()
+        self._cambio((elemento[0],))
+        return elemento
+
+    def setdefault(self, clave, valor=None):
+        if clave not in self:
+            super().setdefault(clave, valor)
+            self._cambio((clave,))
+        return self[clave]
+
+    def update(self, *args, **kwargs):
+        cambios = dict(*args, **kwargs)
+        super().update(cambios)
+        self._cambio(cambios)
+
+    def clear(self):
+        claves = list(self)
+        super().clear()
+        self._cambio(claves)
+
+    def __ior__(self, otro):
+        self.update(otro)
+        return self
+
+class CatalogoLibros(DiccionarioVersionado):
+    pass
+
+class CacheBusqueda:
+    def __init__(self, capacidad=256, ttl=300):
+        if not isinstance(capacidad, int) or capacidad <= 0:
+            raise ValueError("La capacidad de la caché debe ser un número entero positivo.")
+        if ttl is not None and ttl <= 0:
+            raise ValueError("El tiempo de vida de la caché debe ser positivo o None.")
+
+        self.capacidad = capacidad
+        self.ttl = ttl
+        self.entradas = OrderedDict()
+        self.version_catalogo = None
+        self._lock = threading.Lock()
+        self.aciertos = 0
+        self.fallos = 0
+        self.expulsiones = 0
+        self.expiraciones = 0
+        self.invalidaciones = 0
+
+    def _validar_version(self, version_catalogo):
+        if self.version_catalogo != version_catalogo:
+            if self.entradas:
+                self.invalidaciones += 1
+                self.entradas.clear()
+            self.version_catalogo = version_catalogo
+
+    def obtener(self, clave, version_catalogo):
+        with self._lock:
+            self._validar_version(version_catalogo)
+            entrada = self.entradas.get(clave)
+            if entrada is None:
+                self.fallos += 1
+                return None
+            resultados, expira = entrada
+            if expira is not None and time.monotonic() >= expira:
+                del self.entradas[clave]
+                self.expiraciones += 1
+                self.fallos += 1
+                return None
+            self.entradas.move_to_end(clave)
+            self.aciertos += 1
+            return resultados
+
+    def guardar(self, clave, version_catalogo, resultados):
+        with self._lock:
+            self._validar_version(version_catalogo)
+            expira = None if self.ttl is None else time.monotonic() + self.ttl
+            self.entradas[clave] = (tuple(resultados), expira)
+            self.entradas.move_to_end(clave)
+            while len(self.entradas) > self.capacidad:
+                self.entradas.popitem(last=False)
+                self.expulsiones += 1
+
+    def estadisticas(self):
+        with self._lock:
+            consultas = self.aciertos + self.fallos
+            return {
+                "tamano": len(self.entradas),
+                "capacidad": self.capacidad,
+                "aciertos": self.aciertos,
+                "fallos": self.fallos,
+                "tasa_aciertos": self.aciertos / consultas if consultas else 0.0,
+                "expulsiones": self.expulsiones,
+                "expiraciones": self.expiraciones,
+                "invalidaciones": self.invalidaciones
+            }
+
+class Biblioteca:
+    def __init__(self, directorio_archivo=None):
+        self._libros = CatalogoLibros()
+        self._usuarios = DiccionarioVersionado()
         self.prestamos = []
+        self.eventos = BusEventos()
+        self.directorio_archivo = directorio_archivo
+        self.cache_busqueda = None
+        self.tamanos_segmentos = {}
+        self._lock = threading.RLock()
+        self._lock_compactacion = threading.Lock()
+        self._secuencia_eventos = 0
+        self._siguiente_secuencia = 0
+        self._turno_publicacion = threading.Condition()
+        self._version = 0
+        self._version_instantanea = None
+        self._libros_congelados = {}
+        self._usuarios_congelados = {}
+        self._prestamos_congelados = ()
+        self._indice_prestamos = {}
+        self._reconstruir_prestamos = False
+        self._libros_modificados = set()
+        self._usuarios_modificados = set()
+        self._prestamos_modificados = set()
+        self._instantanea = None
+        self.reservas = {}
+        self._reservas_por_isbn = defaultdict(set)
+        self._prestados_por_isbn = defaultdict(int)
+
+        if directorio_archivo is not None and os.path.isdir(directorio_archivo):
+            indice = {}
+            try:
+                with open(os.path.join(directorio_archivo, INDICE_SEGMENTOS), 'r', encoding='utf-8') as f:
+                    indice = json.load(f)
+            except FileNotFoundError:
+                pass
+            except (IOError, OSError, json.JSONDecodeError) as e:
+                print(f"Error al leer el índice de segmentos en '{directorio_archivo}': {e}")
+            for nombre in os.listdir(directorio_archivo):
+                coincidencia = PATRON_SEGMENTO.match(nombre)
+                if coincidencia:
+                    anio, mes = int(coincidencia.group(1)), int(coincidencia.group(2))
+                    tamano = os.path.getsize(os.path.join(directorio_archivo, nombre))
+                    self.tamanos_segmentos[(anio, mes)] = min(indice.get(nombre, tamano), tamano)
+
+    @property
+    def libros(self):
+        return self._libros
+
+    @libros.setter
+    def libros(self, libros):
+        # Reemplazar el catálogo completo mantiene el seguimiento de cambios y nunca reutiliza una versión anterior.
+        catalogo = CatalogoLibros(libros)
+        catalogo.claves_cambiadas.update(self._libros_congelados)
+        catalogo.version = self._libros.version + 1
+        self._libros = catalogo
+
+    @property
+    def usuarios(self):
+        return self._usuarios
+
+    @usuarios.setter
+    def usuarios(self, usuarios):
+        registro = DiccionarioVersionado(usuarios)
+        registro.claves_cambiadas.update(self._usuarios_congelados)
+        self._usuarios = registro
+
+    def _marcar_cambio(self):
+        self._version += 1
 
     def cargar_datos_iniciales(self, archivo):
         try:
             with open(archivo, 'r') as f:
                 data = json.load(f)
+            with self._lock:
                 for libro_data in data.get('libros', []):
                     try:
                         libro = Libro(libro_data['titulo'], libro_data['autor'], libro_data['isbn'], libro_data['cantidad'])
                         self.libros[libro.isbn] = libro
+                        self._marcar_cambio()
                     except (ValueError, KeyError) as e:
                         print(f"Error al cargar libro: {e} en datos: {libro_data}")
                 for usuario_data in data.get('usuarios', []):
@@ -611,6 +1100,7 @@ class Biblioteca:
                              print(f"Advertencia: Usuario con ID {usuario.id_usuario} duplicado, saltando.")
                              continue
                         self.usuarios[usuario.id_usuario] = usuario
+                        self._marcar_cambio()
                     except (ValueError, KeyError) as e:
                         print(f"Error al cargar usuario: {e} en datos: {usuario_data}")
         except FileNotFoundError:
@@ -621,8 +1111,16 @@ class Biblioteca:
             print(f"Error inesperado al cargar datos: {e}")
 
     def buscar_libro(self, criterio, valor):
-        resultados = []
         criterio = criterio.lower()
+        cache = self.cache_busqueda
+        if cache is not None:
+            clave = (criterio, valor.lower())
+            version_catalogo = self.libros.version
+            en_cache = cache.obtener(clave, version_catalogo)
+            if en_cache is not None:
+                return list(en_cache)
+
+        resultados = []
         for libro in self.libros.values():
             if criterio == 'titulo' and valor.lower() in libro.titulo.lower():
                 resultados.append(libro)
@@ -630,21 +1128,48 @@ class Biblioteca:
                 resultados.append(libro)
             elif criterio == 'isbn' and valor.lower() == libro.isbn.lower():
                 resultados.append(libro)
+
+        if cache is not None:
+            cache.guardar(clave, version_catalogo, resultados)
         return resultados
 
-    def registrar_usuario(self, nombre, id_usuario):
-        if id_usuario in self.usuarios:
-            print(f"Error: El usuario con ID {id_usuario} ya existe.")
-            return None
-        try:
-            usuario = Usuario(nombre, id_usuario)
-            self.usuarios[id_usuario] = usuario
-            return usuario
-        except ValueError as e:
-            print(f"Error al registrar usuario: {e}")
+    def activar_cache_busqueda(self, capacidad=256, ttl=300):
+        self.cache_busqueda = CacheBusqueda(capacidad, ttl)
+        return self.cache_busqueda
+
+    def desactivar_cache_busqueda(self):
+        self.cache_busqueda = None
+
+    def estadisticas_cache_busqueda(self):
+        if self.cache_busqueda is None:
             return None
+        return self.cache_busqueda.estadisticas()
+
+    def registrar_usuario(self, nombre, id_usuario):
+        with self._lock:
+            if id_usuario in self.usuarios:
+                print(f"Error: El usuario con ID {id_usuario} ya existe.")
+                return None
+            try:
+                usuario = Usuario(nombre, id_usuario)
+                self.usuarios[id_usuario] = usuario
+                self._marcar_cambio()
+                return usuario
+            except ValueError as e:
+                print(f"Error al registrar usuario: {e}")
+                return None
 
     def registrar_prestamo(self, libro_isbn, usuario_id, fecha_prestamo_str):
+        # Los eventos se recogen y numeran bajo el bloqueo y se publican después de liberarlo, así un suscriptor
+        # lento con política 'bloquear' no detiene al resto de mostradores ni a las instantáneas.
+        pendientes = []
+        with self._lock:
+            prestamo = self._registrar_prestamo(libro_isbn, usuario_id, fecha_prestamo_str, pendientes)
+            self._numerar_eventos(pendientes)
+        self._publicar_eventos(pendientes)
+        return prestamo
+
+    def _registrar_prestamo(self, libro_isbn, usuario_id, fecha_prestamo_str, pendientes):
         if libro_isbn not in self.libros:
             print(f"Error: Libro con ISBN {libro_isbn} no encontrado.")
             return None
@@ -659,20 +1184,70 @@ class Biblioteca:
             print(f"Error: El libro '{libro.titulo}' no está disponible.")
             return None
 
+        # Con reservas pendientes, los ejemplares disponibles corresponden a los primeros de la cola;
+        # quien no ha reservado solo puede llevarse los que sobren.
+        cola = self.reservas.get(libro_isbn)
+        reservado = cola is not None and usuario_id in self._reservas_por_isbn.get(libro_isbn, ())
+        if cola:
+            atendibles = cola.index(usuario_id) < libro.cantidad if reservado else len(cola) < libro.cantidad
+            if not atendibles:
+                print(f"Error: El libro '{libro.titulo}' está reservado; los ejemplares disponibles ({libro.cantidad}) corresponden a las primeras reservas de la cola.")
+                return None
+
         try:
             fecha_prestamo = datetime.datetime.strptime(fecha_prestamo_str, '%Y-%m-%d').date()
-            prestamo = Prestamo(libro, usuario, fecha_prestamo)
-            self.prestamos.append(prestamo)
-            libro.prestar()
-            usuario.agregar_libro_prestado(libro)
-            print(f"Préstamo registrado: '{libro.titulo}' a '{usuario.nombre}'.")
-            return prestamo
+            if reservado:
+                cola.remove(usuario_id)
+                self._reservas_por_isbn[libro_isbn].discard(usuario_id)
+            return self._crear_prestamo(libro, usuario, fecha_prestamo, pendientes)
         except ValueError as e:
             print(f"Error en el formato de la fecha de préstamo: {e}")
             return None
 
+    def _crear_prestamo(self, libro, usuario, fecha_prestamo, pendientes):
+        prestamo = Prestamo(libro, usuario, fecha_prestamo)
+        self.prestamos.append(prestamo)
+        libro.prestar()
+        usuario.agregar_libro_prestado(libro)
+        self._prestados_por_isbn[libro.isbn] += 1
+        self._marcar_cambio()
+        print(f"Préstamo registrado: '{libro.titulo}' a '{usuario.nombre}'.")
+        if self.eventos:
+            pendientes.append(EventoPrestamoRegistrado(prestamo))
+            pendientes.append(EventoCambioStock(libro, libro.cantidad + 1))
+        return prestamo
+
+    def _numerar_eventos(self, pendientes):
+        # El número de secuencia se asigna en el mismo orden en que se aplicaron las escrituras.
+        for evento in pendientes:
+            evento.secuencia = self._secuencia_eventos
+            self._secuencia_eventos += 1
+
+    def _publicar_eventos(self, pendientes):
+        if not pendientes:
+            return
+        # Cada mostrador espera su turno para publicar, de modo que los suscriptores reciben los eventos
+        # en orden de secuencia aunque dos escrituras liberen el bloqueo en orden distinto.
+        with self._turno_publicacion:
+            while self._siguiente_secuencia != pendientes[0].secuencia:
+                self._turno_publicacion.wait()
+        try:
+            for evento in pendientes:
+                self.eventos.publicar(evento)
+        finally:
+            with self._turno_publicacion:
+                self._siguiente_secuencia = pendientes[-1].secuencia + 1
+                self._turno_publicacion.notify_all()
 
     def registrar_devolucion(self, libro_isbn, usuario_id, fecha_devolucion_str):
+        pendientes = []
+        with self._lock:
+            multa = self._registrar_devolucion(libro_isbn, usuario_id, fecha_devolucion_str, pendientes)
+            self._numerar_eventos(pendientes)
+        self._publicar_eventos(pendientes)
+        return multa
+
+    def _registrar_devolucion(self, libro_isbn, usuario_id, fecha_devolucion_str, pendientes):
         for prestamo in self.prestamos:
             if prestamo.libro.isbn == libro_isbn and prestamo.usuario.id_usuario == usuario_id and prestamo.fecha_devolucion is None:
                 try:
@@ -681,8 +1256,12 @@ class Biblioteca:
                     prestamo.registrar_devolucion(fecha_devolucion)
                     prestamo.libro.devolver()
                     prestamo.usuario.remover_libro_prestado(prestamo.libro)
+                    self._prestados_por_isbn[libro_isbn] -= 1
+                    self._marcar_cambio()
                     print(f"Devolución registrada para '{prestamo.libro.titulo}'. Multa: {multa:.2f} euros.")
-                    return multa
+                    if self.eventos:
+                        pendientes.append(EventoDevolucionRegistrada(prestamo, multa))
+                        pendientes.append(EventoCambioStock(prestamo.libro, prestamo.libro.cantidad - 1))
                 except ValueError as e:
                     print(f"Error en el formato de la fecha de devolución: {e}")
                     return None
@@ -690,55 +1269,184 @@ class Biblioteca:
                     print(f"Error al registrar devolución: {e}")
                     return None
 
+                # La devolución ya está registrada: un fallo al atender la reserva no debe ocultar la multa.
+                try:
+                    self._atender_reserva(prestamo.libro, fecha_devolucion, pendientes)
+                except ValueError as e:
+                    print(f"Error al asignar '{prestamo.libro.titulo}' a la siguiente reserva: {e}")
+                return multa
+
         print(f"Error: No se encontró un préstamo activo para el libro con ISBN {libro_isbn} y usuario con ID {usuario_id}.")
         return None
 
+    def reservar(self, libro_isbn, usuario_id):
+        with self._lock:
+            if libro_isbn not in self.libros:
+                print(f"Error: Libro con ISBN {libro_isbn} no encontrado.")
+                return None
+            if usuario_id not in self.usuarios:
+                print(f"Error: Usuario con ID {usuario_id} no encontrado.")
+                return None
+
+            libro = self.libros[libro_isbn]
+            if libro.disponible() and not self.reservas.get(libro_isbn):
+                print(f"Error: El libro '{libro.titulo}' está disponible; registre el préstamo directamente.")
+                return None
+            if usuario_id in self._reservas_por_isbn[libro_isbn]:
+                print(f"Error: El usuario con ID {usuario_id} ya tiene una reserva para '{libro.titulo}'.")
+                return None
+            if libro in self.usuarios[usuario_id].libros_prestados:
+                print(f"Error: El usuario con ID {usuario_id} ya tiene prestado '{libro.titulo}'.")
+                return None
+
+            self.reservas.setdefault(libro_isbn, deque()).append(usuario_id)
+            self._reservas_por_isbn[libro_isbn].add(usuario_id)
+            posicion = len(self.reservas[libro_isbn])
+            print(f"Reserva registrada: '{libro.titulo}' para '{self.usuarios[usuario_id].nombre}' (posición {posicion}).")
+            return posicion
+
+    def cancelar_reserva(self, libro_isbn, usuario_id):
+        with self._lock:
+            if usuario_id not in self._reservas_por_isbn.get(libro_isbn, ()):
+                print(f"Error: No existe una reserva del libro con ISBN {libro_isbn} para el usuario con ID {usuario_id}.")
+                return False
+            self.reservas[libro_isbn].remove(usuario_id)
+            self._reservas_por_isbn[libro_isbn].discard(usuario_id)
+            return True
 
-    def calcular_estadisticas(self):
-        total_libros = len(self.libros)
-        libros_disponibles = sum(libro.cantidad for libro in self.libros.values())
-        total_usuarios = len(self.usuarios)
-        prestamos_activos = sum(1 for prestamo in self.prestamos if prestamo.fecha_devolucion is None)
-        total_multas = sum(prestamo.calcular_multa(datetime.date.today()) for prestamo in self.prestamos if prestamo.fecha_devolucion is None)
-
-        return {
-            "total_libros": total_libros,
-            "libros_disponibles": libros_disponibles,
-            "total_usuarios": total_usuarios,
-            "prestamos_activos": prestamos_activos,
-            "total_multas_pendientes": total_multas
-        }
-
-    def generar_reporte_mensual(self, mes, anio):
-        reporte = f"Reporte Mensual de la Biblioteca - {mes}/{anio}\n"
-        reporte += "=" * 40 + "\n\n"
-
-        prestamos_mes = [
-            p for p in self.prestamos
-            if p.fecha_prestamo.month == mes and p.fecha_prestamo.year == anio
-        ]
-
-        if prestamos_mes:
-            reporte += "Detalle de Préstamos del Mes:\n"
-            for prestamo in prestamos_mes:
-                estado = "Activo" if prestamo.fecha_devolucion is None else f"Devuelto el {prestamo.fecha_devolucion}"
-                multa = prestamo.calcular_multa(datetime.date.today() if prestamo.fecha_devolucion is None else prestamo.fecha_devolucion)
-                reporte += f"- Libro: '{prestamo.libro.titulo}' (ISBN: {prestamo.libro.isbn})\n"
-                reporte += f"  Usuario: '{prestamo.usuario.nombre}' (ID: {prestamo.usuario.id_usuario})\n"
-                reporte += f"  Fecha Préstamo: {prestamo.fecha_prestamo}\n"
-                reporte += f"  Estado: {estado}\n"
-                reporte += f"  Multa calculada: {multa:.2f} euros\n"
-                reporte += "-----\n"
+    def posicion_reserva(self, libro_isbn, usuario_id):
+        with self._lock:
+            if usuario_id not in self._reservas_por_isbn.get(libro_isbn, ()):
+                return None
+            return self.reservas[libro_isbn].index(usuario_id) + 1
+
+    def espera_estimada(self, libro_isbn, usuario_id, dias_permitidos=14):
+        # Estimación en días: cada ronda de devoluciones de los ejemplares en circulación atiende a tantas
+        # reservas como ejemplares haya, y cada ronda dura como máximo el plazo del préstamo.
+        with self._lock:
+            posicion = self.posicion_reserva(libro_isbn, usuario_id)
+            if posicion is None:
+                return None
+            en_circulacion = max(1, self._prestados_por_isbn[libro_isbn])
+            rondas = -(-posicion // en_circulacion)
+            return rondas * dias_permitidos
+
+    def _atender_reserva(self, libro, fecha, pendientes):
+        # Los ejemplares disponibles pasan directamente a las primeras reservas de la cola.
+        atendidas = []
+        cola = self.reservas.get(libro.isbn)
+        while cola and libro.disponible():
+            usuario_id = cola[0]
+            usuario = self.usuarios.get(usuario_id)
+            if usuario is not None:
+                prestamo = self._crear_prestamo(libro, usuario, fecha, pendientes)
+            # La reserva solo sale de la cola una vez creado el préstamo.
+            cola.popleft()
+            self._reservas_por_isbn[libro.isbn].discard(usuario_id)
+            if usuario is None:
+                continue
+            print(f"Notificación: '{libro.titulo}' asignado a '{usuario.nombre}' por reserva.")
+            if self.eventos:
+                pendientes.append(EventoReservaAtendida(prestamo))
+            atendidas.append(prestamo)
+        return atendidas
+
+    def snapshot(self):
+        with self._lock:
+            libros_cambiados = self._claves_modificadas(self.libros, self._libros_modificados, 'isbn')
+            usuarios_cambiados = self._claves_modificadas(self.usuarios, self._usuarios_modificados, 'id_usuario')
+            prestamos_modificados = set(self._prestamos_modificados)
+            self._prestamos_modificados.clear()
+            sin_cambios = (
+                self._version_instantanea == self._version
+                and not libros_cambiados and not usuarios_cambiados and not prestamos_modificados
+                and not self._reconstruir_prestamos and len(self.prestamos) == len(self._prestamos_congelados)
+            )
+            if self._instantanea is not None and sin_cambios:
+                return self._instantanea
+
+            # Solo se congelan de nuevo las claves modificadas y los préstamos añadidos al final de la lista;
+            # las colecciones sin cambios se comparten tal cual con la instantánea anterior.
+            self._libros_congelados = self._actualizar_congelados(
+                self._libros_congelados, self.libros, libros_cambiados, self._libros_modificados, LibroCongelado, CAMPOS_LIBRO
+            )
+            self._usuarios_congelados = self._actualizar_congelados(
+                self._usuarios_congelados, self.usuarios, usuarios_cambiados, self._usuarios_modificados, UsuarioCongelado, campos_usuario
+            )
+            self._prestamos_congelados = self._actualizar_prestamos_congelados(prestamos_modificados)
+            self._version_instantanea = self._version
+
+            self._instantanea = InstantaneaBiblioteca(
+                0 if self._instantanea is None else self._instantanea.version + 1,
+                self._libros_congelados, self._usuarios_congelados, self._prestamos_congelados,
+                self.directorio_archivo, self.tamanos_segmentos
+            )
+            return self._instantanea
+
+    def _seguir(self, objeto, modificados):
+        # A partir de aquí, cualquier asignación sobre el objeto lo anota en el conjunto de modificados.
+        seguimiento = objeto.__dict__.get('_seguimiento')
+        if seguimiento is None:
+            object.__setattr__(objeto, '_seguimiento', [modificados])
+        elif not any(conjunto is modificados for conjunto in seguimiento):
+            seguimiento.append(modificados)
+
+    def _claves_modificadas(self, coleccion, modificados, atributo):
+        claves = set(coleccion.claves_cambiadas)
+        coleccion.claves_cambiadas.clear()
+        objetos = list(modificados)
+        modificados.clear()
+        for objeto in objetos:
+            clave = getattr(objeto, atributo)
+            if coleccion.get(clave) is objeto:
+                claves.add(clave)
+        return claves
+
+    def _actualizar_congelados(self, congelados, coleccion, claves, modificados, tipo, campos):
+        if not claves:
+            return congelados
+        nuevos = dict(congelados)
+        for clave in claves:
+            objeto = coleccion.get(clave)
+            if objeto is None:
+                nuevos.pop(clave, None)
+                continue
+            valores = campos(objeto)
+            if nuevos.get(clave) != valores:
+                nuevos[clave] = tipo._make(valores)
+            self._seguir(objeto, modificados)
+        return nuevos
+
+    def _actualizar_prestamos_congelados(self, modificados):
+        # self.prestamos solo crece por el final salvo en la compactación, que pide reconstruir la tupla.
+        if self._reconstruir_prestamos or len(self.prestamos) < len(self._prestamos_congelados):
+            congelados = []
+            self._indice_prestamos = {}
+            self._reconstruir_prestamos = False
+        elif not modificados and len(self.prestamos) == len(self._prestamos_congelados):
+            return self._prestamos_congelados
         else:
-            reporte += "No hubo préstamos registrados en este mes.\n"
+            congelados = list(self._prestamos_congelados)
+
+        for prestamo in modificados:
+            indice = self._indice_prestamos.get(prestamo)
+            if indice is not None:
+                valores = CAMPOS_PRESTAMO(prestamo)
+                if congelados[indice] != valores:
+                    congelados[indice] = PrestamoCongelado._make(valores)
+
+        for indice in range(len(congelados), len(self.prestamos)):
+            prestamo = self.prestamos[indice]
+            congelados.append(PrestamoCongelado._make(CAMPOS_PRESTAMO(prestamo)))
+            self._indice_prestamos[prestamo] = indice
+            self._seguir(prestamo, self._prestamos_modificados)
+        return tuple(congelados)
 
-        reporte += "\n" + "=" * 40 + "\n"
-        reporte += "Estadísticas Generales:\n"
-        estadisticas = self.calcular_estadisticas()
-        for key, value in estadisticas.items():
-            reporte += f"- {key.replace('_', ' ').title()}: {value}\n"
+    def calcular_estadisticas(self):
+        return self.snapshot().calcular_estadisticas()
 
-        return reporte
+    def generar_reporte_mensual(self, mes, anio):
+        return self.snapshot().generar_reporte_mensual(mes, anio)
 
     def exportar_reporte_txt(self, mes, anio, nombre_archivo):
         reporte_content = self.generar_reporte_mensual(mes, anio)
@@ -749,6 +1457,109 @@ class Biblioteca:
         except IOError as e:
             print(f"Error al exportar el reporte a '{nombre_archivo}': {e}")
 
+    def ruta_segmento(self, mes, anio):
+        return ruta_segmento(self.directorio_archivo, mes, anio)
+
+    def compactar_prestamos(self, dias_recientes=90, fecha_actual=None):
+        if self.directorio_archivo is None:
+            print("Error: No se ha configurado un directorio de archivo para compactar préstamos.")
+            return 0
+        if fecha_actual is None:
+            fecha_actual = datetime.date.today()
+        fecha_corte = fecha_actual - datetime.timedelta(days=dias_recientes)
+
+        with self._lock_compactacion:
+            # Los préstamos cerrados antes de la fecha de corte se agrupan por el mes en que se prestaron,
+            # que es el mismo criterio con el que generar_reporte_mensual los selecciona.
+            segmentos = defaultdict(list)
+            with self._lock:
+                for prestamo in self.prestamos:
+                    if prestamo.fecha_devolucion is not None and prestamo.fecha_devolucion < fecha_corte:
+                        segmentos[(prestamo.fecha_prestamo.year, prestamo.fecha_prestamo.month)].append(prestamo)
+
+            if not segmentos:
+                return 0
+
+            # La escritura se hace fuera del bloqueo principal: los préstamos cerrados ya no cambian y las
+            # instantáneas solo leen los bytes de cada segmento registrados en tamanos_segmentos.
+            tamanos = {}
+            archivados = set()
+            try:
+                os.makedirs(self.directorio_archivo, exist_ok=True)
+            except OSError as e:
+                print(f"Error al archivar préstamos en '{self.directorio_archivo}': {e}")
+                return 0
+            for (anio, mes), prestamos in sorted(segmentos.items()):
+                try:
+                    tamanos[(anio, mes)] = self._anexar_segmento(mes, anio, prestamos)
+                    archivados.update(prestamos)
+                except (IOError, OSError) as e:
+                    # Solo se retiran de memoria los préstamos cuyo segmento quedó escrito por completo.
+                    print(f"Error al archivar préstamos de {mes}/{anio} en '{self.directorio_archivo}': {e}")
+
+            if not archivados:
+                return 0
+
+            with self._lock:
+                self.prestamos = [prestamo for prestamo in self.prestamos if prestamo not in archivados]
+                self.tamanos_segmentos.update(tamanos)
+                self._reconstruir_prestamos = True
+                self._marcar_cambio()
+            self._guardar_indice_segmentos()
+
+        print(f"Compactación completada: {len(archivados)} préstamos archivados en {len(tamanos)} segmentos.")
+        return len(archivados)
+
+    def _anexar_segmento(self, mes, anio, prestamos):
+        # Cada compactación añade un nuevo miembro gzip al final del segmento, sin reescribir lo anterior.
+        # Si la escritura falla, el archivo se recorta al último tamaño válido registrado.
+        ruta = self.ruta_segmento(mes, anio)
+        tamano_previo = self.tamanos_segmentos.get((anio, mes), 0)
+        lineas = "".join(json.dumps(self._serializar_prestamo(prestamo), ensure_ascii=False) + "\n" for prestamo in prestamos)
+        miembro = gzip.compress(lineas.encode('utf-8'))
+        with open(ruta, 'ab') as segmento:
+            try:
+                # Descarta los restos de una escritura anterior interrumpida.
+                segmento.truncate(tamano_previo)
+                segmento.write(miembro)
+                segmento.flush()
+                os.fsync(segmento.fileno())
+            except BaseException:
+                segmento.truncate(tamano_previo)
+                raise
+        return tamano_previo + len(miembro)
+
+    def _guardar_indice_segmentos(self):
+        # El índice es pequeño, así que se reescribe entero y se sustituye de forma atómica.
+        ruta = os.path.join(self.directorio_archivo, INDICE_SEGMENTOS)
+        temporal = ruta + ".tmp"
+        indice = {os.path.basename(self.ruta_segmento(mes, anio)): tamano for (anio, mes), tamano in self.tamanos_segmentos.items()}
+        try:
+            with open(temporal, 'w', encoding='utf-8') as f:
+                json.dump(indice, f, sort_keys=True)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(temporal, ruta)
+        except (IOError, OSError) as e:
+            print(f"Error al guardar el índice de segmentos en '{self.directorio_archivo}': {e}")
+
+    def prestamos_archivados(self, mes, anio):
+        return self.snapshot().prestamos_archivados(mes, anio)
+
+    def prestamos_del_mes(self, mes, anio):
+        return self.snapshot().prestamos_del_mes(mes, anio)
+
+    def _serializar_prestamo(self, prestamo):
+        return {
+            "isbn": prestamo.libro.isbn,
+            "titulo": prestamo.libro.titulo,
+            "autor": prestamo.libro.autor,
+            "id_usuario": prestamo.usuario.id_usuario,
+            "nombre": prestamo.usuario.nombre,
+            "fecha_prestamo": prestamo.fecha_prestamo.isoformat(),
+            "fecha_devolucion": prestamo.fecha_devolucion.isoformat()
+        }
+
 # Crear una instancia de la clase Biblioteca
 biblioteca_export_test = Biblioteca()
 
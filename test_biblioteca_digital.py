@@ -0,0 +1,490 @@
+import datetime
+import importlib
+import os
+import sys
+import threading
+import time
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+ISBN_1984 = "978-0-345-33968-3"
+ISBN_MUNDO = "978-0-06-112008-4"
+
+
+@pytest.fixture(scope="module")
+def directorio_modulo(tmp_path_factory):
+    return tmp_path_factory.mktemp("modulo")
+
+
+@pytest.fixture(scope="module")
+def bd(directorio_modulo):
+    # El módulo escribe datos_iniciales.json y un reporte al importarse; se importa desde un directorio temporal.
+    anterior = os.getcwd()
+    os.chdir(directorio_modulo)
+    try:
+        return importlib.import_module("biblioteca_digital")
+    finally:
+        os.chdir(anterior)
+
+
+@pytest.fixture
+def biblioteca(bd, directorio_modulo, tmp_path):
+    b = bd.Biblioteca(directorio_archivo=str(tmp_path / "archivo"))
+    b.cargar_datos_iniciales(str(directorio_modulo / "datos_iniciales.json"))
+    return b
+
+
+def test_eventos_prestamo_y_devolucion(bd, biblioteca):
+    suscripcion = biblioteca.eventos.suscribir()
+    biblioteca.registrar_prestamo(ISBN_1984, "U001", "2023-10-01")
+    multa = biblioteca.registrar_devolucion(ISBN_1984, "U001", "2023-10-30")
+
+    eventos = suscripcion.vaciar()
+    assert [type(e) for e in eventos] == [
+        bd.EventoPrestamoRegistrado, bd.EventoCambioStock,
+        bd.EventoDevolucionRegistrada, bd.EventoCambioStock,
+    ]
+    assert eventos[1].cantidad_anterior == 3 and eventos[1].cantidad_nueva == 2
+    assert eventos[2].multa == multa == 7.5
+    assert eventos[3].cantidad_anterior == 2 and eventos[3].cantidad_nueva == 3
+
+
+def test_eventos_se_entregan_en_orden_de_escritura(bd, biblioteca, monkeypatch):
+    suscripcion = biblioteca.eventos.suscribir()
+    publicar = biblioteca._publicar_eventos
+    primero = threading.Event()
+
+    def publicar_con_retraso(pendientes):
+        # El primer mostrador se retrasa tras liberar el bloqueo, antes de publicar.
+        if not primero.is_set():
+            primero.set()
+            time.sleep(0.2)
+        publicar(pendientes)
+
+    monkeypatch.setattr(biblioteca, "_publicar_eventos", publicar_con_retraso)
+    lento = threading.Thread(target=biblioteca.registrar_prestamo, args=(ISBN_1984, "U001", "2023-10-01"))
+    lento.start()
+    assert primero.wait(timeout=5.0)
+    biblioteca.registrar_prestamo(ISBN_1984, "U002", "2023-10-01")
+    lento.join(timeout=5.0)
+
+    eventos = suscripcion.vaciar()
+    assert [e.secuencia for e in eventos] == [0, 1, 2, 3]
+    stock = [(e.cantidad_anterior, e.cantidad_nueva) for e in eventos if isinstance(e, bd.EventoCambioStock)]
+    assert stock == [(3, 2), (2, 1)]
+
+
+def test_suscripcion_filtra_por_tipo(bd, biblioteca):
+    suscripcion = biblioteca.eventos.suscribir(tipos=[bd.EventoDevolucionRegistrada])
+    biblioteca.registrar_prestamo(ISBN_1984, "U001", "2023-10-01")
+    biblioteca.registrar_devolucion(ISBN_1984, "U001", "2023-10-02")
+    assert [type(e) for e in suscripcion.vaciar()] == [bd.EventoDevolucionRegistrada]
+
+
+def test_politica_descartar_nuevo(bd):
+    bus = bd.BusEventos()
+    suscripcion = bus.suscribir(capacidad=2, politica='descartar_nuevo')
+    for i in range(4):
+        bus.publicar(i)
+    assert suscripcion.vaciar() == [0, 1]
+    estadisticas = suscripcion.estadisticas()
+    assert estadisticas["eventos_entregados"] == 2
+    assert estadisticas["eventos_descartados"] == 2
+    assert estadisticas["desbordamientos"] == 2
+
+
+def test_politica_descartar_antiguo(bd):
+    bus = bd.BusEventos()
+    suscripcion = bus.suscribir(capacidad=2, politica='descartar_antiguo')
+    for i in range(4):
+        bus.publicar(i)
+    assert suscripcion.vaciar() == [2, 3]
+    assert suscripcion.estadisticas()["eventos_descartados"] == 2
+
+
+def test_politica_bloquear_espera_al_consumidor(bd):
+    bus = bd.BusEventos()
+    suscripcion = bus.suscribir(capacidad=1, politica='bloquear', espera_maxima=2.0)
+    bus.publicar("a")
+
+    consumidor = threading.Timer(0.1, suscripcion.recibir)
+    consumidor.start()
+    bus.publicar("b")
+    consumidor.join()
+
+    assert suscripcion.vaciar() == ["b"]
+    assert suscripcion.estadisticas()["eventos_descartados"] == 0
+
+
+def test_politica_bloquear_descarta_tras_espera_maxima(bd):
+    bus = bd.BusEventos()
+    suscripcion = bus.suscribir(capacidad=1, politica='bloquear', espera_maxima=0.05)
+    bus.publicar("a")
+    bus.publicar("b")
+    assert suscripcion.vaciar() == ["a"]
+    assert suscripcion.estadisticas()["eventos_descartados"] == 1
+
+
+def test_bus_sin_suscriptores_y_cancelacion(bd):
+    bus = bd.BusEventos()
+    assert not bus
+    suscripcion = bus.suscribir()
+    assert bus
+    suscripcion.cancelar()
+    assert not bus
+    bus.publicar("ignorado")
+    assert len(suscripcion) == 0
+
+
+def test_suscripcion_valida_parametros(bd):
+    with pytest.raises(ValueError):
+        bd.BusEventos().suscribir(capacidad=0)
+    with pytest.raises(ValueError):
+        bd.BusEventos().suscribir(politica='otra')
+
+
+def _prestar_y_devolver(biblioteca, isbn, usuario, prestamo, devolucion):
+    biblioteca.registrar_prestamo(isbn, usuario, prestamo)
+    biblioteca.registrar_devolucion(isbn, usuario, devolucion)
+
+
+def test_compactacion_y_reporte_desde_segmentos(bd, biblioteca, tmp_path):
+    _prestar_y_devolver(biblioteca, ISBN_1984, "U001", "2023-10-01", "2023-10-20")
+    _prestar_y_devolver(biblioteca, ISBN_1984, "U002", "2023-10-03", "2023-10-21")
+    biblioteca.registrar_prestamo(ISBN_MUNDO, "U002", "2023-10-05")
+
+    assert biblioteca.compactar_prestamos(fecha_actual=datetime.date(2024, 6, 1)) == 2
+    assert len(biblioteca.prestamos) == 1
+    assert sorted(os.listdir(tmp_path / "archivo")) == ["indice_segmentos.json", "prestamos_2023_10.jsonl.gz"]
+
+    _prestar_y_devolver(biblioteca, ISBN_1984, "U001", "2023-10-07", "2023-10-22")
+    assert biblioteca.compactar_prestamos(fecha_actual=datetime.date(2024, 6, 1)) == 1
+
+    del_mes = list(biblioteca.prestamos_del_mes(10, 2023))
+    assert [(p.id_usuario, p.fecha_prestamo.day) for p in del_mes] == [("U001", 1), ("U002", 3), ("U001", 7), ("U002", 5)]
+    assert biblioteca.generar_reporte_mensual(10, 2023).count("Fecha Préstamo:") == 4
+
+    recargada = bd.Biblioteca(directorio_archivo=str(tmp_path / "archivo"))
+    assert len(list(recargada.prestamos_del_mes(10, 2023))) == 3
+
+
+def test_compactacion_conserva_prestamos_recientes_y_activos(biblioteca):
+    _prestar_y_devolver(biblioteca, ISBN_1984, "U001", "2024-05-01", "2024-05-20")
+    biblioteca.registrar_prestamo(ISBN_MUNDO, "U002", "2023-10-05")
+    assert biblioteca.compactar_prestamos(fecha_actual=datetime.date(2024, 6, 1)) == 0
+    assert len(biblioteca.prestamos) == 2
+
+
+def test_compactacion_sin_directorio(bd):
+    assert bd.Biblioteca().compactar_prestamos() == 0
+
+
+def test_fallo_al_escribir_un_segmento_no_duplica_prestamos(bd, biblioteca, tmp_path, monkeypatch):
+    _prestar_y_devolver(biblioteca, ISBN_1984, "U001", "2023-09-01", "2023-09-10")
+    _prestar_y_devolver(biblioteca, ISBN_1984, "U001", "2023-10-01", "2023-10-10")
+
+    sincronizar = os.fsync
+    llamadas = []
+
+    def sincronizacion_fallida(descriptor):
+        # Falla la segunda escritura (el segmento de octubre) después de haber escrito sus datos.
+        llamadas.append(descriptor)
+        if len(llamadas) == 2:
+            raise OSError("disco lleno")
+        sincronizar(descriptor)
+
+    monkeypatch.setattr(bd.os, "fsync", sincronizacion_fallida)
+    assert biblioteca.compactar_prestamos(fecha_actual=datetime.date(2024, 6, 1)) == 1
+    assert [p.fecha_prestamo.month for p in biblioteca.prestamos] == [10]
+    assert os.path.getsize(tmp_path / "archivo" / "prestamos_2023_10.jsonl.gz") == 0
+
+    monkeypatch.setattr(bd.os, "fsync", sincronizar)
+    assert biblioteca.compactar_prestamos(fecha_actual=datetime.date(2024, 6, 1)) == 1
+    assert biblioteca.prestamos == []
+    assert biblioteca.generar_reporte_mensual(10, 2023).count("Fecha Préstamo:") == 1
+
+    recargada = bd.Biblioteca(directorio_archivo=str(tmp_path / "archivo"))
+    assert len(list(recargada.prestamos_del_mes(9, 2023))) == 1
+    assert len(list(recargada.prestamos_del_mes(10, 2023))) == 1
+
+
+def test_restos_de_una_escritura_interrumpida_se_ignoran_y_se_recortan(bd, biblioteca, tmp_path):
+    _prestar_y_devolver(biblioteca, ISBN_1984, "U001", "2023-10-01", "2023-10-10")
+    assert biblioteca.compactar_prestamos(fecha_actual=datetime.date(2024, 6, 1)) == 1
+    segmento = tmp_path / "archivo" / "prestamos_2023_10.jsonl.gz"
+    tamano = os.path.getsize(segmento)
+    with open(segmento, "ab") as f:
+        f.write(b"\x1f\x8b restos")
+
+    recargada = bd.Biblioteca(directorio_archivo=str(tmp_path / "archivo"))
+    assert recargada.tamanos_segmentos[(2023, 10)] == tamano
+    assert len(list(recargada.prestamos_del_mes(10, 2023))) == 1
+
+    _prestar_y_devolver(biblioteca, ISBN_1984, "U002", "2023-10-05", "2023-10-12")
+    assert biblioteca.compactar_prestamos(fecha_actual=datetime.date(2024, 6, 1)) == 1
+    assert os.path.getsize(segmento) == biblioteca.tamanos_segmentos[(2023, 10)]
+    assert len(list(biblioteca.prestamos_del_mes(10, 2023))) == 2
+
+
+def test_suscriptor_bloqueante_no_retiene_el_bloqueo_de_la_biblioteca(biblioteca):
+    # La espera máxima es amplia para que el escritor siga bloqueado en la publicación durante el test.
+    suscripcion = biblioteca.eventos.suscribir(capacidad=1, politica='bloquear', espera_maxima=10.0)
+    escritor = threading.Thread(target=biblioteca.registrar_prestamo, args=(ISBN_1984, "U001", "2023-10-01"))
+    escritor.start()
+    limite = time.monotonic() + 5.0
+    while not len(suscripcion) and time.monotonic() < limite:
+        time.sleep(0.01)
+    assert len(suscripcion) == 1
+
+    instantanea = biblioteca.snapshot()
+    assert escritor.is_alive()
+    assert instantanea.libros[ISBN_1984].cantidad == 2
+
+    assert suscripcion.recibir(timeout=1.0) is not None
+    escritor.join(timeout=5.0)
+    assert not escritor.is_alive()
+    assert suscripcion.recibir(timeout=1.0) is not None
+
+
+def test_instantanea_aislada_de_escrituras_posteriores(biblioteca):
+    antes = biblioteca.snapshot()
+    assert biblioteca.snapshot() is antes
+    biblioteca.registrar_prestamo(ISBN_1984, "U001", "2023-10-01")
+    despues = biblioteca.snapshot()
+
+    assert despues is not antes
+    assert antes.libros[ISBN_1984].cantidad == 3 and despues.libros[ISBN_1984].cantidad == 2
+    assert antes.prestamos == () and len(despues.prestamos) == 1
+    assert antes.usuarios["U001"].isbns_prestados == ()
+    assert despues.usuarios["U001"].isbns_prestados == (ISBN_1984,)
+    # Los registros que no cambiaron se comparten entre versiones.
+    assert antes.libros[ISBN_MUNDO] is despues.libros[ISBN_MUNDO]
+    assert antes.usuarios["U002"] is despues.usuarios["U002"]
+    with pytest.raises(TypeError):
+        despues.libros["nuevo"] = None
+
+
+def test_instantanea_ve_libros_agregados_directamente_al_catalogo(bd, biblioteca):
+    assert biblioteca.calcular_estadisticas()["total_libros"] == 3
+    biblioteca.libros["isbn-nuevo"] = bd.Libro("Nuevo", "Autor", "isbn-nuevo", 2)
+    assert biblioteca.calcular_estadisticas()["total_libros"] == 4
+    biblioteca.libros["isbn-nuevo"] = bd.Libro("Nuevo", "Autor", "isbn-nuevo", 5)
+    assert biblioteca.snapshot().libros["isbn-nuevo"].cantidad == 5
+    del biblioteca.libros["isbn-nuevo"]
+    assert "isbn-nuevo" not in biblioteca.snapshot().libros
+
+
+def test_instantanea_no_duplica_prestamos_compactados_despues(biblioteca):
+    _prestar_y_devolver(biblioteca, ISBN_1984, "U001", "2023-10-01", "2023-10-20")
+    antes = biblioteca.snapshot()
+    biblioteca.compactar_prestamos(fecha_actual=datetime.date(2024, 6, 1))
+    _prestar_y_devolver(biblioteca, ISBN_1984, "U002", "2023-10-02", "2023-10-20")
+    intermedia = biblioteca.snapshot()
+    biblioteca.compactar_prestamos(fecha_actual=datetime.date(2024, 6, 1))
+
+    assert len(list(antes.prestamos_del_mes(10, 2023))) == 1
+    assert len(list(intermedia.prestamos_del_mes(10, 2023))) == 2
+    assert len(list(biblioteca.prestamos_del_mes(10, 2023))) == 2
+
+
+def _agotar(biblioteca, isbn, usuarios, fecha="2024-01-01"):
+    for usuario in usuarios:
+        assert biblioteca.registrar_prestamo(isbn, usuario, fecha) is not None
+
+
+def test_reserva_rechazada_si_hay_ejemplares(biblioteca):
+    assert biblioteca.reservar(ISBN_MUNDO, "U001") is None
+    assert biblioteca.reservas.get(ISBN_MUNDO) is None
+
+
+def test_devolucion_asigna_el_ejemplar_a_la_primera_reserva(bd, biblioteca):
+    biblioteca.registrar_usuario("Carlos Gómez", "U003")
+    biblioteca.registrar_usuario("Lucía Díaz", "U004")
+    _agotar(biblioteca, ISBN_MUNDO, ["U001", "U002"])
+    assert biblioteca.reservar(ISBN_MUNDO, "U003") == 1
+    assert biblioteca.reservar(ISBN_MUNDO, "U004") == 2
+    assert biblioteca.reservar(ISBN_MUNDO, "U003") is None
+    assert biblioteca.posicion_reserva(ISBN_MUNDO, "U004") == 2
+    assert biblioteca.espera_estimada(ISBN_MUNDO, "U004") == 14
+
+    suscripcion = biblioteca.eventos.suscribir(tipos=[bd.EventoReservaAtendida])
+    assert biblioteca.registrar_devolucion(ISBN_MUNDO, "U002", "2024-01-10") == 0
+    atendidas = suscripcion.vaciar()
+    assert [(e.id_usuario, e.fecha) for e in atendidas] == [("U003", datetime.date(2024, 1, 10))]
+    assert biblioteca.libros[ISBN_MUNDO].cantidad == 0
+    assert biblioteca.libros[ISBN_MUNDO] in biblioteca.usuarios["U003"].libros_prestados
+    assert biblioteca.posicion_reserva(ISBN_MUNDO, "U003") is None
+    assert biblioteca.posicion_reserva(ISBN_MUNDO, "U004") == 1
+
+
+def test_reserva_rechazada_si_el_usuario_tiene_el_libro(biblioteca):
+    biblioteca.registrar_usuario("Carlos Gómez", "U003")
+    _agotar(biblioteca, ISBN_MUNDO, ["U001", "U002"])
+    assert biblioteca.reservar(ISBN_MUNDO, "U001") is None
+    assert biblioteca.reservar(ISBN_MUNDO, "U003") == 1
+
+
+def test_prestamo_directo_respeta_la_cola_de_reservas(biblioteca):
+    biblioteca.registrar_usuario("Carlos Gómez", "U003")
+    _agotar(biblioteca, ISBN_MUNDO, ["U001", "U002"])
+    biblioteca.reservar(ISBN_MUNDO, "U003")
+    biblioteca.libros[ISBN_MUNDO].devolver()
+
+    assert biblioteca.registrar_prestamo(ISBN_MUNDO, "U001", "2024-01-05") is None
+    assert list(biblioteca.reservas[ISBN_MUNDO]) == ["U003"]
+    assert biblioteca.registrar_prestamo(ISBN_MUNDO, "U003", "2024-01-05") is not None
+    assert list(biblioteca.reservas[ISBN_MUNDO]) == []
+
+
+def test_varios_ejemplares_atienden_varias_reservas(bd, biblioteca):
+    for i in range(3, 7):
+        biblioteca.registrar_usuario(f"Usuario {i}", f"U00{i}")
+    _agotar(biblioteca, ISBN_MUNDO, ["U001", "U002"])
+    for usuario in ["U003", "U004", "U005", "U006"]:
+        biblioteca.reservar(ISBN_MUNDO, usuario)
+
+    # Con dos ejemplares repuestos, los dos primeros de la cola pueden llevárselos en cualquier orden.
+    biblioteca.libros[ISBN_MUNDO].cantidad += 2
+    assert biblioteca.registrar_prestamo(ISBN_MUNDO, "U005", "2024-01-05") is None
+    assert biblioteca.registrar_prestamo(ISBN_MUNDO, "U004", "2024-01-05") is not None
+    assert list(biblioteca.reservas[ISBN_MUNDO]) == ["U003", "U005", "U006"]
+
+    # Una devolución con ejemplares ya libres reparte todos los disponibles entre la cola.
+    suscripcion = biblioteca.eventos.suscribir(tipos=[bd.EventoReservaAtendida])
+    biblioteca.registrar_devolucion(ISBN_MUNDO, "U001", "2024-01-10")
+    assert [e.id_usuario for e in suscripcion.vaciar()] == ["U003", "U005"]
+    assert list(biblioteca.reservas[ISBN_MUNDO]) == ["U006"]
+    assert biblioteca.libros[ISBN_MUNDO].cantidad == 0
+
+    # Quien no reservó solo recibe los ejemplares que sobran tras atender la cola.
+    biblioteca.libros[ISBN_MUNDO].cantidad += 1
+    assert biblioteca.registrar_prestamo(ISBN_MUNDO, "U001", "2024-01-11") is None
+    biblioteca.libros[ISBN_MUNDO].cantidad += 1
+    assert biblioteca.registrar_prestamo(ISBN_MUNDO, "U001", "2024-01-11") is not None
+    assert list(biblioteca.reservas[ISBN_MUNDO]) == ["U006"]
+
+
+def test_fallo_al_atender_reserva_no_oculta_la_multa(bd, biblioteca, monkeypatch):
+    biblioteca.registrar_usuario("Carlos Gómez", "U003")
+    _agotar(biblioteca, ISBN_MUNDO, ["U001", "U002"], fecha="2024-01-01")
+    biblioteca.reservar(ISBN_MUNDO, "U003")
+
+    def fallo(*args):
+        raise ValueError("fallo simulado")
+
+    monkeypatch.setattr(biblioteca, "_crear_prestamo", fallo)
+    assert biblioteca.registrar_devolucion(ISBN_MUNDO, "U001", "2024-01-25") == 5.0
+    assert biblioteca.libros[ISBN_MUNDO].cantidad == 1
+    assert biblioteca.posicion_reserva(ISBN_MUNDO, "U003") == 1
+
+
+def test_cancelar_reserva(biblioteca):
+    _agotar(biblioteca, ISBN_MUNDO, ["U001", "U002"])
+    biblioteca.registrar_usuario("Carlos Gómez", "U003")
+    biblioteca.reservar(ISBN_MUNDO, "U003")
+    assert biblioteca.cancelar_reserva(ISBN_MUNDO, "U003") is True
+    assert biblioteca.cancelar_reserva(ISBN_MUNDO, "U003") is False
+    assert biblioteca.registrar_devolucion(ISBN_MUNDO, "U001", "2024-01-05") == 0
+    assert biblioteca.libros[ISBN_MUNDO].cantidad == 1
+
+
+def test_cache_busqueda_aciertos_y_expulsiones(biblioteca):
+    assert biblioteca.estadisticas_cache_busqueda() is None
+    biblioteca.activar_cache_busqueda(capacidad=2, ttl=None)
+
+    primera = biblioteca.buscar_libro('titulo', '1984')
+    segunda = biblioteca.buscar_libro('TITULO', '1984')
+    assert [l.isbn for l in primera] == [l.isbn for l in segunda] == [ISBN_1984]
+    segunda.clear()
+    assert len(biblioteca.buscar_libro('titulo', '1984')) == 1
+
+    biblioteca.buscar_libro('autor', 'huxley')
+    biblioteca.buscar_libro('autor', 'orwell')
+    biblioteca.buscar_libro('titulo', '1984')
+
+    estadisticas = biblioteca.estadisticas_cache_busqueda()
+    assert estadisticas["aciertos"] == 2
+    assert estadisticas["fallos"] == 4
+    assert estadisticas["expulsiones"] == 2
+    assert estadisticas["tamano"] == 2
+
+
+def test_cache_busqueda_expira_por_ttl(biblioteca):
+    biblioteca.activar_cache_busqueda(capacidad=4, ttl=0.05)
+    biblioteca.buscar_libro('titulo', '1984')
+    time.sleep(0.1)
+    biblioteca.buscar_libro('titulo', '1984')
+    estadisticas = biblioteca.estadisticas_cache_busqueda()
+    assert estadisticas["expiraciones"] == 1 and estadisticas["aciertos"] == 0
+
+
+def test_cache_busqueda_se_invalida_al_modificar_el_catalogo(bd, biblioteca):
+    biblioteca.activar_cache_busqueda()
+    assert len(biblioteca.buscar_libro('titulo', '1984')) == 1
+
+    biblioteca.libros["isbn-a"] = bd.Libro("1984 (edición anotada)", "George Orwell", "isbn-a", 1)
+    assert len(biblioteca.buscar_libro('titulo', '1984')) == 2
+
+    biblioteca.libros |= {"isbn-b": bd.Libro("1984 (bolsillo)", "George Orwell", "isbn-b", 1)}
+    assert len(biblioteca.buscar_libro('titulo', '1984')) == 3
+
+    biblioteca.libros.pop("isbn-a")
+    assert len(biblioteca.buscar_libro('titulo', '1984')) == 2
+    assert biblioteca.estadisticas_cache_busqueda()["invalidaciones"] == 3
+
+
+def test_catalogo_solo_cambia_de_version_si_se_modifica(bd):
+    catalogo = bd.CatalogoLibros()
+    assert catalogo.pop("inexistente", None) is None
+    with pytest.raises(KeyError):
+        catalogo.pop("inexistente")
+    assert catalogo.version == 0
+
+    libro = bd.Libro("Titulo", "Autor", "isbn", 1)
+    catalogo.setdefault("isbn", libro)
+    catalogo.setdefault("isbn", libro)
+    assert catalogo.version == 1
+    catalogo |= {"otro": libro}
+    assert isinstance(catalogo, bd.CatalogoLibros) and catalogo.version == 2
+
+
+def test_instantanea_ve_cambios_directos_sobre_los_objetos(biblioteca):
+    assert biblioteca.calcular_estadisticas()["libros_disponibles"] == 10
+    biblioteca.libros[ISBN_1984].cantidad += 10
+    assert biblioteca.calcular_estadisticas()["libros_disponibles"] == 20
+
+    biblioteca.registrar_prestamo(ISBN_MUNDO, "U002", "2024-01-01")
+    assert biblioteca.calcular_estadisticas()["libros_disponibles"] == 19
+
+    prestamo = biblioteca.prestamos[0]
+    prestamo.registrar_devolucion(datetime.date(2024, 1, 3))
+    prestamo.libro.devolver()
+    instantanea = biblioteca.snapshot()
+    assert instantanea.prestamos[0].fecha_devolucion == datetime.date(2024, 1, 3)
+    assert instantanea.calcular_estadisticas()["libros_disponibles"] == 20
+
+
+def test_instantanea_comparte_colecciones_sin_cambios(biblioteca):
+    antes = biblioteca.snapshot()
+    biblioteca.libros[ISBN_1984].cantidad += 1
+    despues = biblioteca.snapshot()
+    assert despues is not antes
+    assert despues.prestamos is antes.prestamos
+    assert despues.libros[ISBN_MUNDO] is antes.libros[ISBN_MUNDO]
+    assert despues.libros[ISBN_1984].cantidad == 4
+
+
+def test_reposicion_seguida_de_una_escritura_no_relacionada(bd, biblioteca):
+    biblioteca.snapshot()
+    biblioteca.libros[ISBN_1984].cantidad += 10
+    biblioteca.registrar_prestamo(ISBN_MUNDO, "U002", "2024-01-01")
+    instantanea = biblioteca.snapshot()
+    assert instantanea.libros[ISBN_1984].cantidad == 13
+    assert instantanea.calcular_estadisticas()["libros_disponibles"] == 19
+    assert instantanea.usuarios["U002"].isbns_prestados == (ISBN_MUNDO,)
+
+    # Reemplazar el catálogo completo también se refleja en la siguiente instantánea.
+    biblioteca.libros = {ISBN_1984: bd.Libro("1984", "George Orwell", ISBN_1984, 1)}
+    assert set(biblioteca.snapshot().libros) == {ISBN_1984}